@@ -1,12 +1,22 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, render_template_string
+from flask import Flask, render_template, request, redirect, url_for, flash, session, send_file, render_template_string, Response
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+import math
 import base64
 from io import BytesIO
 import pdfkit
+import csv
+import zipfile
+import zlib
+import click
+import queue
+import threading
+from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
+from contextlib import contextmanager
 
 # Ensure pdfkit is installed and configured if needed for PDF generation.
 # On some systems, you might need to install wkhtmltopdf:
@@ -71,6 +81,17 @@ def init_db():
                   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                   FOREIGN KEY (user_id) REFERENCES users (id))''')
     
+    # Per tour, per departure day rollups for the analytics page, kept up to date by
+    # the booking routes (see update_tour_stats) and rebuildable with rebuild_tour_stats
+    c.execute('''CREATE TABLE IF NOT EXISTS tour_daily_stats
+                 (tour_id INTEGER NOT NULL,
+                  day TEXT NOT NULL,
+                  bookings INTEGER DEFAULT 0,
+                  participants INTEGER DEFAULT 0,
+                  confirmed_revenue REAL DEFAULT 0,
+                  cancellations INTEGER DEFAULT 0,
+                  PRIMARY KEY (tour_id, day))''')
+    
     # Check if admin user exists
     c.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
     if c.fetchone()[0] == 0:
@@ -93,10 +114,56 @@ def init_db():
             c.execute("INSERT INTO tours (name, description, price, region, duration, difficulty, featured, tour_type, available_seats, group_start_date) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", tour)
     
     conn.commit()
+
+    # Let the archival job hand freed pages back to the OS with incremental vacuum.
+    # Switching an existing database over requires one full VACUUM.
+    if c.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        c.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        c.execute('VACUUM')
+
     conn.close()
 
+def init_archive_db():
+    conn = sqlite3.connect(ARCHIVE_DB)
+    c = conn.cursor()
+
+    # Same columns as the hot tables, plus when each record was archived
+    c.execute('''CREATE TABLE IF NOT EXISTS bookings
+                 (id INTEGER PRIMARY KEY,
+                  user_id INTEGER,
+                  tour_id INTEGER,
+                  tour_name TEXT NOT NULL,
+                  tour_date TEXT NOT NULL,
+                  participants INTEGER DEFAULT 1,
+                  total_price REAL NOT NULL,
+                  status TEXT DEFAULT 'pending',
+                  admin_confirmed BOOLEAN DEFAULT 0,
+                  created_at TIMESTAMP,
+                  archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_bookings_user_id ON bookings (user_id)')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS support_tickets
+                 (id INTEGER PRIMARY KEY,
+                  user_id INTEGER,
+                  subject TEXT NOT NULL,
+                  message TEXT NOT NULL,
+                  status TEXT DEFAULT 'open',
+                  admin_response TEXT,
+                  created_at TIMESTAMP,
+                  archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_support_tickets_user_id ON support_tickets (user_id)')
+
+    conn.commit()
+    conn.close()
+
+# Archived (cold) bookings and tickets live in a separate database file
+ARCHIVE_DB = 'archive.db'
+ARCHIVE_RETENTION_DAYS = 180
+ARCHIVE_BATCH_SIZE = 500
+
 # Initialize database
 init_db()
+init_archive_db()
 
 # Helper functions
 def get_db_connection():
@@ -104,6 +171,10 @@ def get_db_connection():
     conn.row_factory = sqlite3.Row
     return conn
 
+def attach_archive(conn):
+    conn.execute('ATTACH DATABASE ? AS archive', (ARCHIVE_DB,))
+    return conn
+
 def is_admin():
     return 'user_role' in session and session['user_role'] == 'admin'
 
@@ -120,6 +191,427 @@ def format_currency(amount):
     """Format amount as PKR currency"""
     return "PKR {:,.0f}".format(amount)
 
+# --- Bulk tour import ---
+
+TOUR_DIFFICULTIES = ('Easy', 'Moderate', 'Challenging')
+TOUR_TYPES = ('private', 'group')
+TOUR_TEXT_FIELDS = ('name', 'description', 'region', 'duration', 'difficulty', 'tour_type', 'group_start_date', 'image')
+MAX_IMAGE_SIZE = 16 * 1024 * 1024
+IMPORT_IMAGE_WORKERS = 8
+# Manifest rows whose images are held in memory at once during an import
+IMPORT_CHUNK_SIZE = 25
+
+# Leading bytes of the image formats accepted by the tour form
+IMAGE_SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a')
+
+def is_supported_image(blob):
+    # WebP is a RIFF container, so check the form type too; WAV and AVI are RIFF as well
+    if blob[:4] == b'RIFF' and blob[8:12] == b'WEBP':
+        return True
+    return blob.startswith(IMAGE_SIGNATURES)
+
+def parse_tour_manifest(filename, data):
+    """Parse a CSV or JSON tour manifest into a list of row dicts"""
+    text = data.decode('utf-8-sig') if isinstance(data, bytes) else data
+    if filename.lower().endswith('.json'):
+        rows = json.loads(text)
+        if isinstance(rows, dict):
+            rows = rows.get('tours', [])
+        if not isinstance(rows, list):
+            raise ValueError('JSON manifest must be a list of tours or an object with a "tours" list.')
+        return rows
+    return list(csv.DictReader(StringIO(text)))
+
+def validate_tour_row(row):
+    """Validate one manifest row; returns (tour_dict, None) or (None, error message)"""
+    if not isinstance(row, dict):
+        return None, 'Row is not an object.'
+
+    # JSON manifests can hold any value type; CSV values are always strings or None
+    for key in TOUR_TEXT_FIELDS:
+        value = row.get(key)
+        if value is not None and not isinstance(value, str):
+            return None, f'Field "{key}" must be text.'
+
+    def field(key):
+        value = row.get(key)
+        return value.strip() if isinstance(value, str) else value
+
+    name = field('name')
+    if not name:
+        return None, 'Missing tour name.'
+
+    price = field('price')
+    if isinstance(price, bool) or not isinstance(price, (str, int, float)):
+        return None, 'Invalid price.'
+    try:
+        price = float(price)
+    except ValueError:
+        return None, 'Invalid price.'
+    # NaN and infinity parse as floats but cannot be stored as a price
+    if not math.isfinite(price):
+        return None, 'Invalid price.'
+    if price < 0:
+        return None, 'Price cannot be negative.'
+
+    difficulty = field('difficulty') or 'Moderate'
+    if difficulty not in TOUR_DIFFICULTIES:
+        return None, f"Difficulty must be one of: {', '.join(TOUR_DIFFICULTIES)}."
+
+    tour_type = (field('tour_type') or 'private').lower()
+    if tour_type not in TOUR_TYPES:
+        return None, f"Tour type must be one of: {', '.join(TOUR_TYPES)}."
+
+    available_seats = field('available_seats') or 0
+    if isinstance(available_seats, float) and available_seats.is_integer():
+        available_seats = int(available_seats)
+    if isinstance(available_seats, bool) or not isinstance(available_seats, (str, int)):
+        return None, 'Invalid number of available seats.'
+    try:
+        available_seats = int(available_seats)
+    except ValueError:
+        return None, 'Invalid number of available seats.'
+    if available_seats < 0:
+        return None, 'Available seats cannot be negative.'
+
+    group_start_date = field('group_start_date') or None
+    if group_start_date:
+        try:
+            datetime.strptime(group_start_date, '%Y-%m-%d')
+        except ValueError:
+            return None, 'Group start date must be in YYYY-MM-DD format.'
+    if tour_type == 'group' and not group_start_date:
+        return None, 'Group tours require a group start date.'
+
+    featured = field('featured')
+    if isinstance(featured, str):
+        featured = featured.lower() in ('1', 'yes', 'true', 'on')
+    elif featured is not None and not isinstance(featured, (bool, int)):
+        return None, 'Featured must be yes/no.'
+
+    return {
+        'name': name,
+        'description': field('description') or '',
+        'price': price,
+        'region': field('region') or '',
+        'duration': field('duration') or '',
+        'difficulty': difficulty,
+        'featured': 1 if featured else 0,
+        'tour_type': tour_type,
+        'available_seats': available_seats,
+        'group_start_date': group_start_date,
+        'image': field('image') or None,
+    }, None
+
+@contextmanager
+def open_image_source(path_or_file):
+    """Yield a callable that reads an image by name from a directory or ZIP archive"""
+    if path_or_file is None:
+        yield None
+        return
+    if isinstance(path_or_file, str) and os.path.isdir(path_or_file):
+        base = os.path.realpath(path_or_file)
+
+        def read_from_dir(name):
+            path = os.path.realpath(os.path.join(base, name))
+            if not path.startswith(base + os.sep):
+                raise KeyError(name)
+            with open(path, 'rb') as f:
+                return f.read(MAX_IMAGE_SIZE + 1)
+        yield read_from_dir
+        return
+
+    with zipfile.ZipFile(path_or_file) as archive:
+        # ZipFile serialises access to the underlying file, so workers can share it
+        def read_from_zip(name):
+            with archive.open(name) as f:
+                return f.read(MAX_IMAGE_SIZE + 1)
+        yield read_from_zip
+
+def load_tour_image(read_image, name):
+    """Read and check a single image; returns (blob, None) or (None, error message)"""
+    try:
+        blob = read_image(name)
+    except (KeyError, FileNotFoundError, IsADirectoryError):
+        return None, f'Image "{name}" not found.'
+    except (OSError, zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError) as e:
+        # ZipFile raises RuntimeError for encrypted entries and NotImplementedError
+        # for unsupported compression methods
+        return None, f'Could not read image "{name}": {e}'
+    if len(blob) > MAX_IMAGE_SIZE:
+        return None, f'Image "{name}" is larger than 16MB.'
+    if not is_supported_image(blob):
+        return None, f'"{name}" is not a supported image file.'
+    return blob, None
+
+INSERT_TOUR_QUERY = '''
+    INSERT INTO tours (name, description, price, region, duration, difficulty, featured, tour_type, available_seats, group_start_date, image)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def insert_tour_chunk(conn, chunk, read_image, pool, errors):
+    """Load one chunk's images in the pool and insert the chunk; returns the number inserted"""
+    names = list(dict.fromkeys(tour['image'] for _, tour in chunk if tour['image']))
+    images = dict(zip(names, pool.map(lambda name: load_tour_image(read_image, name), names)))
+
+    row_numbers = []
+    params = []
+    for row_number, tour in chunk:
+        blob = None
+        if tour['image']:
+            blob, error = images[tour['image']]
+            if error:
+                errors.append((row_number, error))
+                continue
+        row_numbers.append(row_number)
+        params.append((tour['name'], tour['description'], tour['price'], tour['region'],
+                       tour['duration'], tour['difficulty'], tour['featured'], tour['tour_type'],
+                       tour['available_seats'], tour['group_start_date'], blob))
+
+    conn.execute('SAVEPOINT tour_chunk')
+    try:
+        conn.executemany(INSERT_TOUR_QUERY, params)
+        imported = len(params)
+    except sqlite3.Error:
+        # Something validation missed; insert row by row so only the offending
+        # rows are skipped and reported instead of failing the whole import
+        conn.execute('ROLLBACK TO tour_chunk')
+        imported = 0
+        for row_number, row_params in zip(row_numbers, params):
+            try:
+                conn.execute(INSERT_TOUR_QUERY, row_params)
+                imported += 1
+            except sqlite3.Error as e:
+                errors.append((row_number, f'Could not save tour: {e}'))
+    conn.execute('RELEASE tour_chunk')
+    return imported
+
+def import_tours(conn, rows, image_source=None):
+    """Validate manifest rows and insert every valid tour inside one transaction.
+
+    Rows go in with executemany in chunks of IMPORT_CHUNK_SIZE, each chunk's images
+    loaded in a thread pool, so only one chunk of images is held in memory at a time.
+
+    Returns (imported_count, errors) where errors is a list of (row_number, message)."""
+    errors = []
+    valid = []
+    # Row numbers are 1-based positions in the manifest, not counting the CSV header
+    for row_number, row in enumerate(rows, start=1):
+        tour, error = validate_tour_row(row)
+        if error:
+            errors.append((row_number, error))
+        else:
+            valid.append((row_number, tour))
+
+    if image_source is None:
+        errors.extend((n, 'Row references an image but no image directory or ZIP was given.')
+                      for n, tour in valid if tour['image'])
+        valid = [(n, tour) for n, tour in valid if not tour['image']]
+
+    imported = 0
+    with open_image_source(image_source) as read_image, \
+            ThreadPoolExecutor(max_workers=IMPORT_IMAGE_WORKERS) as pool, conn:
+        conn.execute('BEGIN')
+        for start in range(0, len(valid), IMPORT_CHUNK_SIZE):
+            chunk = valid[start:start + IMPORT_CHUNK_SIZE]
+            imported += insert_tour_chunk(conn, chunk, read_image, pool, errors)
+
+    errors.sort()
+    return imported, errors
+
+# --- Archival of old bookings and tickets ---
+
+BOOKING_COLUMNS = 'id, user_id, tour_id, tour_name, tour_date, participants, total_price, status, admin_confirmed, created_at'
+TICKET_COLUMNS = 'id, user_id, subject, message, status, admin_response, created_at'
+
+def archive_batches(conn, table, columns, where, params, batch_size):
+    """Move rows matching `where` from main.<table> into archive.<table>, one batch per transaction"""
+    moved = 0
+    while True:
+        ids = [row[0] for row in conn.execute(
+            f'SELECT id FROM main.{table} WHERE {where} ORDER BY id LIMIT ?', (*params, batch_size))]
+        if not ids:
+            return moved
+        placeholders = ', '.join('?' * len(ids))
+        with conn:
+            conn.execute(f'''
+                INSERT OR REPLACE INTO archive.{table} ({columns})
+                SELECT {columns} FROM main.{table} WHERE id IN ({placeholders})
+            ''', ids)
+            conn.execute(f'DELETE FROM main.{table} WHERE id IN ({placeholders})', ids)
+        moved += len(ids)
+
+def archive_old_records(retention_days=ARCHIVE_RETENTION_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move cancelled or past bookings and closed tickets older than the retention
+    window into the archive database, then reclaim the freed pages.
+
+    Returns (archived_bookings, archived_tickets)."""
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    cutoff_timestamp = cutoff.strftime('%Y-%m-%d %H:%M:%S')
+    cutoff_date = cutoff.strftime('%Y-%m-%d')
+
+    conn = attach_archive(get_db_connection())
+    try:
+        archived_bookings = archive_batches(
+            conn, 'bookings', BOOKING_COLUMNS,
+            "(status = 'cancelled' AND created_at < ?) OR tour_date < ?",
+            (cutoff_timestamp, cutoff_date), batch_size)
+        archived_tickets = archive_batches(
+            conn, 'support_tickets', TICKET_COLUMNS,
+            "status = 'closed' AND created_at < ?",
+            (cutoff_timestamp,), batch_size)
+
+        if archived_bookings or archived_tickets:
+            # Each step of the pragma frees one page, so drain it completely
+            conn.execute('PRAGMA main.incremental_vacuum').fetchall()
+    finally:
+        conn.close()
+    return archived_bookings, archived_tickets
+
+# --- Revenue and occupancy rollups ---
+
+def booking_stats(status, participants, total_price):
+    """Contribution of one booking in `status` to (bookings, participants, confirmed_revenue, cancellations)"""
+    if status is None:
+        return (0, 0, 0, 0)
+    cancelled = status == 'cancelled'
+    return (1,
+            0 if cancelled else participants,
+            total_price if status == 'confirmed' else 0,
+            1 if cancelled else 0)
+
+def update_tour_stats(conn, tour_id, day, participants, total_price, old_status, new_status):
+    """Apply a booking write to tour_daily_stats; None as a status means the booking does not exist.
+
+    Call inside the same transaction as the booking write so the rollup never drifts."""
+    old = booking_stats(old_status, participants, total_price)
+    new = booking_stats(new_status, participants, total_price)
+    delta = tuple(n - o for n, o in zip(new, old))
+    if not any(delta):
+        return
+    conn.execute('''
+        INSERT INTO tour_daily_stats (tour_id, day, bookings, participants, confirmed_revenue, cancellations)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (tour_id, day) DO UPDATE SET
+            bookings = bookings + excluded.bookings,
+            participants = participants + excluded.participants,
+            confirmed_revenue = confirmed_revenue + excluded.confirmed_revenue,
+            cancellations = cancellations + excluded.cancellations
+    ''', (tour_id, day, *delta))
+
+def rebuild_tour_stats():
+    """Recompute tour_daily_stats from every live and archived booking in one transaction"""
+    conn = attach_archive(get_db_connection())
+    try:
+        with conn:
+            conn.execute('DELETE FROM main.tour_daily_stats')
+            conn.execute(f'''
+                INSERT INTO main.tour_daily_stats (tour_id, day, bookings, participants, confirmed_revenue, cancellations)
+                SELECT tour_id, tour_date, COUNT(*),
+                       SUM(CASE WHEN status != 'cancelled' THEN participants ELSE 0 END),
+                       SUM(CASE WHEN status = 'confirmed' THEN total_price ELSE 0 END),
+                       SUM(CASE WHEN status = 'cancelled' THEN 1 ELSE 0 END)
+                FROM (SELECT {BOOKING_COLUMNS} FROM main.bookings
+                      UNION ALL
+                      SELECT {BOOKING_COLUMNS} FROM archive.bookings)
+                WHERE tour_id IS NOT NULL
+                GROUP BY tour_id, tour_date
+            ''')
+        return conn.execute('SELECT COUNT(*) FROM main.tour_daily_stats').fetchone()[0]
+    finally:
+        conn.close()
+
+def init_tour_stats():
+    # Backfill the rollups once when they are added to a database that already has bookings
+    conn = attach_archive(get_db_connection())
+    needs_backfill = conn.execute('''
+        SELECT NOT EXISTS (SELECT 1 FROM main.tour_daily_stats)
+           AND (EXISTS (SELECT 1 FROM main.bookings) OR EXISTS (SELECT 1 FROM archive.bookings))
+    ''').fetchone()[0]
+    conn.close()
+    if needs_backfill:
+        rebuild_tour_stats()
+
+init_tour_stats()
+
+# --- Live admin updates (Server-Sent Events) ---
+
+SSE_BUFFER_SIZE = 100
+SSE_HEARTBEAT_SECONDS = 15
+
+def format_sse(event, data, event_id=None):
+    message = f'event: {event}\ndata: {json.dumps(data)}\n\n'
+    if event_id is not None:
+        message = f'id: {event_id}\n' + message
+    return message
+
+class EventBroker:
+    """Fans out admin events to every open admin tab.
+
+    Each event is serialised once and pushed to a bounded queue per subscriber.
+    A subscriber that falls too far behind has its backlog dropped and is sent a
+    single "resync" event so the page can reload instead of replaying stale deltas.
+    Events carry increasing ids so a page or reconnecting tab can tell whether it
+    missed any. Ids are prefixed with a token per process, so ids handed out before
+    a restart never match ones issued after it."""
+
+    def __init__(self, buffer_size=SSE_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self.subscribers = set()
+        self.boot_token = os.urandom(4).hex()
+        self.last_id = 0
+        self.lock = threading.Lock()
+
+    def event_id(self, number):
+        return f'{self.boot_token}-{number}'
+
+    @property
+    def last_event_id(self):
+        with self.lock:
+            return self.event_id(self.last_id)
+
+    def subscribe(self):
+        """Register a subscriber; returns (queue, id of the last event already published)"""
+        subscriber = queue.Queue(maxsize=self.buffer_size)
+        with self.lock:
+            self.subscribers.add(subscriber)
+            return subscriber, self.event_id(self.last_id)
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, event, data):
+        with self.lock:
+            self.last_id += 1
+            message = format_sse(event, data, self.event_id(self.last_id))
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                self.reset(subscriber)
+
+    def reset(self, subscriber):
+        try:
+            while True:
+                subscriber.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            subscriber.put_nowait(format_sse('resync', {}))
+        except queue.Full:
+            pass
+
+# Events only reach admin tabs served by this process
+admin_events = EventBroker()
+
+def publish_event(event, counters=None, **data):
+    """Publish an admin event; `counters` holds deltas for the dashboard cards"""
+    if counters:
+        data['counters'] = counters
+    admin_events.publish(event, data)
+
 # --- Routes (Refactored to use render_template) ---
 
 @app.route('/')
@@ -216,6 +708,7 @@ def register():
             conn.execute('INSERT INTO users (name, email, password, phone, address) VALUES (?, ?, ?, ?, ?)',
                          (name, email, password, phone, address))
             conn.commit()
+            publish_event('counters', counters={'total_users': 1})
             flash('Registration successful! Please log in.', 'success')
             return redirect(url_for('login'))
         except sqlite3.IntegrityError:
@@ -255,11 +748,16 @@ def profile():
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('profile'))
     
-    bookings = conn.execute('''
-        SELECT * FROM bookings 
-        WHERE user_id = ? 
+    # Include bookings the archival job has moved out of the hot database
+    attach_archive(conn)
+    bookings = conn.execute(f'''
+        SELECT {BOOKING_COLUMNS}, 0 AS archived FROM main.bookings
+        WHERE user_id = ?
+        UNION ALL
+        SELECT {BOOKING_COLUMNS}, 1 AS archived FROM archive.bookings
+        WHERE user_id = ?
         ORDER BY created_at DESC
-    ''', (user_id,)).fetchall()
+    ''', (user_id, user_id)).fetchall()
     
     conn.close()
     
@@ -302,10 +800,12 @@ def book_tour(tour_id):
                     flash(f"Group tour must be booked for the specified start date: {tour_dict['group_start_date']}", 'error')
                     return redirect(url_for('book_tour', tour_id=tour_id))
             
-            conn.execute('''
+            cursor = conn.execute('''
                 INSERT INTO bookings (user_id, tour_id, tour_name, tour_date, participants, total_price) 
                 VALUES (?, ?, ?, ?, ?, ?)
             ''', (user_id, tour_id, tour_dict['name'], tour_date, participants, total_price))
+            booking_id = cursor.lastrowid
+            update_tour_stats(conn, tour_id, tour_date, participants, total_price, None, 'pending')
             
             # Deduct seats for group tours
             if tour_dict['tour_type'] == 'group' and tour_dict['available_seats'] > 0:
@@ -313,6 +813,19 @@ def book_tour(tour_id):
                 conn.execute('UPDATE tours SET available_seats = ? WHERE id = ?', (new_seats, tour_id))
                 
             conn.commit()
+
+            user = conn.execute('SELECT name, email FROM users WHERE id = ?', (user_id,)).fetchone()
+            publish_event('booking_created', counters={'pending_bookings': 1}, booking={
+                'id': booking_id,
+                'user_name': user['name'] if user else session.get('user_name'),
+                'user_email': user['email'] if user else None,
+                'tour_name': tour_dict['name'],
+                'tour_date': tour_date,
+                'participants': participants,
+                'total_price': total_price,
+                'status': 'pending',
+                'admin_confirmed': 0,
+            })
             flash('Tour booked successfully! Check your profile for details.', 'success')
             return redirect(url_for('profile'))
             
@@ -344,15 +857,23 @@ def cancel_booking(booking_id):
     booking = conn.execute('SELECT * FROM bookings WHERE id = ? AND user_id = ?', (booking_id, user_id)).fetchone()
     
     if booking:
+        # The delete re-checks the status so a booking an admin confirms at the
+        # same moment is not removed or subtracted from the rollups
+        deleted = 0
         if booking['status'] == 'pending' and not booking['admin_confirmed']:
+            deleted = conn.execute('DELETE FROM bookings WHERE id = ? AND status = "pending" AND admin_confirmed = 0',
+                                   (booking_id,)).rowcount
+        if deleted:
             # Refund seats for group tours
             tour = conn.execute('SELECT id, available_seats, tour_type FROM tours WHERE id = ?', (booking['tour_id'],)).fetchone()
             if tour and tour['tour_type'] == 'group':
-                new_seats = tour['available_seats'] + booking['participants']
-                conn.execute('UPDATE tours SET available_seats = ? WHERE id = ?', (new_seats, tour['id']))
+                conn.execute('UPDATE tours SET available_seats = available_seats + ? WHERE id = ?',
+                             (booking['participants'], tour['id']))
                 
-            conn.execute('DELETE FROM bookings WHERE id = ?', (booking_id,))
+            update_tour_stats(conn, booking['tour_id'], booking['tour_date'], booking['participants'],
+                              booking['total_price'], booking['status'], None)
             conn.commit()
+            publish_event('booking_deleted', counters={'pending_bookings': -1}, booking_id=booking_id)
             flash('Booking cancelled successfully.', 'success')
         else:
             flash('Cannot cancel confirmed or processed bookings.', 'error')
@@ -374,10 +895,15 @@ def contact():
         message = request.form['message']
         
         conn = get_db_connection()
-        conn.execute('INSERT INTO support_tickets (user_id, subject, message) VALUES (?, ?, ?)',
-                     (user_id, subject, message))
+        cursor = conn.execute('INSERT INTO support_tickets (user_id, subject, message) VALUES (?, ?, ?)',
+                              (user_id, subject, message))
         conn.commit()
         conn.close()
+        publish_event('ticket_created', counters={'open_tickets': 1}, ticket={
+            'id': cursor.lastrowid,
+            'user_name': session.get('user_name'),
+            'subject': subject,
+        })
         flash('Support ticket submitted successfully. We will respond soon.', 'success')
         return redirect(url_for('contact'))
         
@@ -390,6 +916,8 @@ def about():
 @app.route('/admin_dashboard')
 @require_admin
 def admin_dashboard():
+    # Read before the queries so any event published after them is caught by the stream
+    event_id = admin_events.last_event_id
     conn = get_db_connection()
     total_users = conn.execute('SELECT COUNT(*) FROM users WHERE role = "user"').fetchone()[0]
     total_tours = conn.execute('SELECT COUNT(*) FROM tours').fetchone()[0]
@@ -410,7 +938,36 @@ def admin_dashboard():
                            total_tours=total_tours, 
                            pending_bookings=pending_bookings, 
                            open_tickets=open_tickets,
-                           recent_bookings=recent_bookings)
+                           recent_bookings=recent_bookings,
+                           event_id=event_id)
+
+@app.route('/admin_events')
+@require_admin
+def admin_events_stream():
+    # The page passes the event id it was rendered at as ?since=; EventSource sends
+    # the last id it saw as Last-Event-ID when it reconnects after a drop. Either way,
+    # if events were published since then the tab missed them and has to reload.
+    seen_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+
+    def stream():
+        subscriber, last_id = admin_events.subscribe()
+        try:
+            # Hand out an id straight away so even a quiet connection reports
+            # Last-Event-ID when it comes back
+            yield f'id: {last_id}\nretry: {SSE_HEARTBEAT_SECONDS * 1000}\n\n'
+            if seen_id is not None and seen_id != last_id:
+                yield format_sse('resync', {})
+            while True:
+                try:
+                    yield subscriber.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ': heartbeat\n\n'
+        finally:
+            admin_events.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/admin_tours', methods=['GET', 'POST'])
 @require_admin
@@ -440,6 +997,7 @@ def admin_tours():
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (name, description, price, region, duration, difficulty, featured, tour_type, available_seats, group_start_date, image_blob))
         conn.commit()
+        publish_event('counters', counters={'total_tours': 1})
         flash('New tour added successfully!', 'success')
         return redirect(url_for('admin_tours'))
 
@@ -502,15 +1060,55 @@ def admin_edit_tour(tour_id):
 @require_admin
 def admin_delete_tour(tour_id):
     conn = get_db_connection()
-    conn.execute('DELETE FROM tours WHERE id = ?', (tour_id,))
+    deleted = conn.execute('DELETE FROM tours WHERE id = ?', (tour_id,)).rowcount
     conn.commit()
     conn.close()
+    if deleted:
+        publish_event('counters', counters={'total_tours': -1})
     flash('Tour deleted successfully.', 'success')
     return redirect(url_for('admin_tours'))
 
+@app.route('/admin_import_tours', methods=['GET', 'POST'])
+@require_admin
+def admin_import_tours():
+    if request.method == 'POST':
+        manifest_file = request.files.get('manifest')
+        if not manifest_file or manifest_file.filename == '':
+            flash('Please choose a CSV or JSON manifest to import.', 'error')
+            return redirect(url_for('admin_import_tours'))
+
+        images_file = request.files.get('images')
+        image_source = images_file.stream if images_file and images_file.filename != '' else None
+
+        try:
+            rows = parse_tour_manifest(manifest_file.filename, manifest_file.read())
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            flash(f'Could not read manifest: {e}', 'error')
+            return redirect(url_for('admin_import_tours'))
+
+        conn = get_db_connection()
+        try:
+            imported, errors = import_tours(conn, rows, image_source)
+        except zipfile.BadZipFile:
+            flash('The images file is not a valid ZIP archive.', 'error')
+            return redirect(url_for('admin_import_tours'))
+        finally:
+            conn.close()
+
+        if imported:
+            publish_event('counters', counters={'total_tours': imported})
+            flash(f'{imported} tour(s) imported successfully!', 'success')
+        if errors:
+            flash(f'{len(errors)} row(s) were skipped. See the details below.', 'warning')
+        return render_template('admin/import_tours.html', errors=errors, imported=imported)
+
+    return render_template('admin/import_tours.html', errors=None, imported=None)
+
 @app.route('/admin_bookings')
 @require_admin
 def admin_bookings():
+    # Read before the query so any event published after it is caught by the stream
+    event_id = admin_events.last_event_id
     conn = get_db_connection()
     bookings = conn.execute('''
         SELECT b.*, u.name as user_name, u.email as user_email, t.name as tour_name 
@@ -520,16 +1118,36 @@ def admin_bookings():
         ORDER BY b.created_at DESC
     ''').fetchall()
     conn.close()
-    return render_template('admin/bookings.html', bookings=bookings)
+    return render_template('admin/bookings.html', bookings=bookings, event_id=event_id)
 
 @app.route('/admin_confirm_booking/<int:booking_id>')
 @require_admin
 def admin_confirm_booking(booking_id):
     conn = get_db_connection()
-    conn.execute('UPDATE bookings SET status = "confirmed", admin_confirmed = 1 WHERE id = ?', (booking_id,))
+    booking = conn.execute('SELECT * FROM bookings WHERE id = ?', (booking_id,)).fetchone()
+    
+    if booking is None:
+        conn.close()
+        flash('Booking not found.', 'error')
+        return redirect(url_for('admin_bookings'))
+    
+    # Only apply the change if the status is still the one read above, so two admins
+    # confirming at once cannot both count the booking in the rollups
+    updated = conn.execute('UPDATE bookings SET status = "confirmed", admin_confirmed = 1 WHERE id = ? AND status = ?',
+                           (booking_id, booking['status'])).rowcount
+    if updated:
+        update_tour_stats(conn, booking['tour_id'], booking['tour_date'], booking['participants'],
+                          booking['total_price'], booking['status'], 'confirmed')
     conn.commit()
     conn.close()
-    flash('Booking confirmed.', 'success')
+    
+    if updated:
+        publish_event('booking_status',
+                      counters={'pending_bookings': -1} if booking['status'] == 'pending' else None,
+                      booking_id=booking_id, status='confirmed', admin_confirmed=1)
+        flash('Booking confirmed.', 'success')
+    else:
+        flash('Booking was changed by someone else. Please review it and try again.', 'warning')
     return redirect(url_for('admin_bookings'))
 
 @app.route('/admin_cancel_booking/<int:booking_id>')
@@ -539,15 +1157,27 @@ def admin_cancel_booking(booking_id):
     booking = conn.execute('SELECT * FROM bookings WHERE id = ?', (booking_id,)).fetchone()
     
     if booking:
-        # Refund seats for group tours
-        tour = conn.execute('SELECT id, available_seats, tour_type FROM tours WHERE id = ?', (booking['tour_id'],)).fetchone()
-        if tour and tour['tour_type'] == 'group':
-            new_seats = tour['available_seats'] + booking['participants']
-            conn.execute('UPDATE tours SET available_seats = ? WHERE id = ?', (new_seats, tour['id']))
-            
-        conn.execute('UPDATE bookings SET status = "cancelled", admin_confirmed = 0 WHERE id = ?', (booking_id,))
+        # Only apply the change if the status is still the one read above, so a
+        # concurrent confirm or cancel cannot be counted twice in the rollups
+        updated = conn.execute('UPDATE bookings SET status = "cancelled", admin_confirmed = 0 WHERE id = ? AND status = ?',
+                               (booking_id, booking['status'])).rowcount
+        if updated:
+            # Refund seats for group tours
+            tour = conn.execute('SELECT id, available_seats, tour_type FROM tours WHERE id = ?', (booking['tour_id'],)).fetchone()
+            if tour and tour['tour_type'] == 'group':
+                conn.execute('UPDATE tours SET available_seats = available_seats + ? WHERE id = ?',
+                             (booking['participants'], tour['id']))
+            update_tour_stats(conn, booking['tour_id'], booking['tour_date'], booking['participants'],
+                              booking['total_price'], booking['status'], 'cancelled')
         conn.commit()
-        flash('Booking cancelled.', 'info')
+        
+        if updated:
+            publish_event('booking_status',
+                          counters={'pending_bookings': -1} if booking['status'] == 'pending' else None,
+                          booking_id=booking_id, status='cancelled', admin_confirmed=0)
+            flash('Booking cancelled.', 'info')
+        else:
+            flash('Booking was changed by someone else. Please review it and try again.', 'warning')
     else:
         flash('Booking not found.', 'error')
         
@@ -563,9 +1193,14 @@ def admin_tickets():
         ticket_id = request.form['ticket_id']
         response = request.form['response']
         
+        ticket = conn.execute('SELECT status FROM support_tickets WHERE id = ?', (ticket_id,)).fetchone()
         conn.execute('UPDATE support_tickets SET admin_response = ?, status = "closed" WHERE id = ?', 
                      (response, ticket_id))
         conn.commit()
+        if ticket:
+            publish_event('ticket_closed',
+                          counters={'open_tickets': -1} if ticket['status'] == 'open' else None,
+                          ticket_id=int(ticket_id))
         flash(f'Ticket #{ticket_id} closed and response sent.', 'success')
         return redirect(url_for('admin_tickets'))
         
@@ -578,6 +1213,63 @@ def admin_tickets():
     conn.close()
     return render_template('admin/tickets.html', tickets=tickets)
 
+@app.route('/admin_archive', methods=['POST'])
+@require_admin
+def admin_archive():
+    archived_bookings, archived_tickets = archive_old_records()
+    if archived_bookings or archived_tickets:
+        # Archived rows vanish from the admin lists; let open tabs reload
+        admin_events.publish('resync', {})
+    flash(f'Archived {archived_bookings} booking(s) and {archived_tickets} ticket(s) older than {ARCHIVE_RETENTION_DAYS} days.', 'success')
+    return redirect(url_for('admin_dashboard'))
+
+@app.route('/admin_analytics')
+@require_admin
+def admin_analytics():
+    conn = get_db_connection()
+    tour_stats = conn.execute('''
+        SELECT s.tour_id, COALESCE(t.name, 'Tour #' || s.tour_id) as tour_name,
+               SUM(s.bookings) as bookings, SUM(s.participants) as participants,
+               SUM(s.confirmed_revenue) as confirmed_revenue, SUM(s.cancellations) as cancellations
+        FROM tour_daily_stats s
+        LEFT JOIN tours t ON s.tour_id = t.id
+        GROUP BY s.tour_id
+        ORDER BY confirmed_revenue DESC
+    ''').fetchall()
+    
+    monthly_stats = conn.execute('''
+        SELECT substr(day, 1, 7) as month,
+               SUM(bookings) as bookings, SUM(participants) as participants,
+               SUM(confirmed_revenue) as confirmed_revenue, SUM(cancellations) as cancellations
+        FROM tour_daily_stats
+        GROUP BY month
+        ORDER BY month DESC
+    ''').fetchall()
+    
+    # Seats are deducted from available_seats as bookings come in, so the
+    # departure's capacity is what is left plus what has been booked
+    departures = conn.execute('''
+        SELECT t.id, t.name, t.group_start_date, t.available_seats,
+               COALESCE(s.participants, 0) as booked_seats
+        FROM tours t
+        LEFT JOIN tour_daily_stats s ON s.tour_id = t.id AND s.day = t.group_start_date
+        WHERE t.tour_type = 'group'
+        ORDER BY t.group_start_date DESC
+    ''').fetchall()
+    conn.close()
+    
+    return render_template('admin/analytics.html',
+                           tour_stats=tour_stats,
+                           monthly_stats=monthly_stats,
+                           departures=departures)
+
+@app.route('/admin_rebuild_stats', methods=['POST'])
+@require_admin
+def admin_rebuild_stats():
+    rows = rebuild_tour_stats()
+    flash(f'Analytics rebuilt from all bookings ({rows} tour day(s)).', 'success')
+    return redirect(url_for('admin_analytics'))
+
 @app.route('/admin_users')
 @require_admin
 def admin_users():
@@ -595,6 +1287,8 @@ def admin_delete_user(user_id):
     if user and user['role'] != 'admin':
         conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
         conn.commit()
+        if user['role'] == 'user':
+            publish_event('counters', counters={'total_users': -1})
         flash(f"User {user['name']} deleted successfully.", 'success')
     else:
         flash('Cannot delete admin user or user not found.', 'error')
@@ -610,12 +1304,17 @@ def download_invoice(booking_id):
         
     user_id = session['user_id']
     conn = get_db_connection()
-    booking = conn.execute('''
+    invoice_query = '''
         SELECT b.*, u.name as user_name, u.email as user_email, u.address as user_address, u.phone as user_phone
-        FROM bookings b
+        FROM {} b
         JOIN users u ON b.user_id = u.id
         WHERE b.id = ? AND b.user_id = ?
-    ''', (booking_id, user_id)).fetchone()
+    '''
+    booking = conn.execute(invoice_query.format('main.bookings'), (booking_id, user_id)).fetchone()
+    if booking is None:
+        # Fall back to bookings moved out by the archival job
+        attach_archive(conn)
+        booking = conn.execute(invoice_query.format('archive.bookings'), (booking_id, user_id)).fetchone()
     conn.close()
     
     if booking is None:
@@ -719,6 +1418,45 @@ def download_invoice(booking_id):
         flash(f'Could not generate PDF invoice. Ensure wkhtmltopdf is installed. Error: {e}', 'error')
         return redirect(url_for('profile'))
 
+# --- CLI Commands ---
+
+@app.cli.command('import-tours')
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option('--images', type=click.Path(exists=True), help='Directory or ZIP archive holding the images named in the manifest.')
+def import_tours_command(manifest, images):
+    """Bulk import tours from a CSV or JSON manifest into database.db."""
+    with open(manifest, 'rb') as f:
+        try:
+            rows = parse_tour_manifest(manifest, f.read())
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            raise click.ClickException(f'Could not read manifest: {e}')
+
+    conn = get_db_connection()
+    try:
+        imported, errors = import_tours(conn, rows, images)
+    except zipfile.BadZipFile:
+        raise click.ClickException('The images file is not a valid ZIP archive.')
+    finally:
+        conn.close()
+
+    for row_number, message in errors:
+        click.echo(f'Row {row_number}: {message}', err=True)
+    click.echo(f'Imported {imported} tour(s), skipped {len(errors)} row(s).')
+
+@app.cli.command('archive-data')
+@click.option('--days', default=ARCHIVE_RETENTION_DAYS, show_default=True, help='Archive records older than this many days.')
+@click.option('--batch-size', default=ARCHIVE_BATCH_SIZE, show_default=True, help='Rows moved per transaction.')
+def archive_data_command(days, batch_size):
+    """Move old bookings and closed tickets into archive.db and vacuum database.db."""
+    archived_bookings, archived_tickets = archive_old_records(days, batch_size)
+    click.echo(f'Archived {archived_bookings} booking(s) and {archived_tickets} ticket(s).')
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute the analytics rollups from all live and archived bookings."""
+    rows = rebuild_tour_stats()
+    click.echo(f'Rebuilt tour_daily_stats with {rows} tour day(s).')
+
 # --- Main Run Block ---
 if __name__ == '__main__':
     app.run(debug=True)